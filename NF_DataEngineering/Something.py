@@ -24,7 +24,9 @@ oscar_nominees = pd.DataFrame(data)
 # ----------------------------
 # Filter and compute result
 # ----------------------------
-nominee = oscar_nominees[oscar_nominees['nominee'] == 'Abigail Breslin']
-result = nominee.movie.nunique()
+# Work on the underlying arrays: no filtered DataFrame, no intermediate Series
+movies = oscar_nominees['movie'].to_numpy()
+mask = oscar_nominees['nominee'].to_numpy() == 'Abigail Breslin'
+result = np.unique(movies[mask]).size
 
 print("Number of unique movies for Abigail Breslin:", result)
@@ -1,8 +1,50 @@
 # Import your libraries
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
-def compute_actor_differences(actor_rating_shift: pd.DataFrame) -> pd.DataFrame:
+try:
+    from numba import njit
+except ImportError:  # numba is optional; compute_actor_differences falls back to numpy.lexsort
+    njit = None
+
+
+def _latest_and_sums(codes, dates, ratings, title_codes, n_groups):
+    """
+    One linear scan: per-group rating sum/count plus the "latest" rating, keeping the
+    best-so-far (date desc, rating desc, title asc) row per group. No sort needed.
+    NaN ratings are skipped in the sum/count and rank below any rating on the same date,
+    matching pandas' skipna aggregations and na_position="last" sorting.
+    Rows with group code -1 (missing actor_name) are skipped, as groupby drops NaN keys.
+    """
+    sums = np.zeros(n_groups, dtype=np.float64)
+    counts = np.zeros(n_groups, dtype=np.int64)
+    seen = np.zeros(n_groups, dtype=np.bool_)
+    latest = np.zeros(n_groups, dtype=np.float64)
+    best_date = np.zeros(n_groups, dtype=np.int64)
+    best_title = np.zeros(n_groups, dtype=np.int64)
+    for i in range(codes.shape[0]):
+        g = codes[i]
+        if g < 0:
+            continue
+        d, r, t = dates[i], ratings[i], title_codes[i]
+        r_nan, l_nan = np.isnan(r), np.isnan(latest[g])
+        higher = not r_nan and (l_nan or r > latest[g])
+        same = (r_nan and l_nan) or r == latest[g]
+        if not seen[g] or d > best_date[g] or (
+            d == best_date[g] and (higher or (same and t < best_title[g]))
+        ):
+            best_date[g], latest[g], best_title[g] = d, r, t
+            seen[g] = True
+        if not r_nan:
+            sums[g] += r
+            counts[g] += 1
+    return latest, sums, counts, seen
+
+
+_latest_and_sums_jit = njit(cache=True)(_latest_and_sums) if njit is not None else None
+
+def compute_actor_differences(actor_rating_shift: pd.DataFrame, use_jit: bool = True) -> pd.DataFrame:
     """
     For each actor, compute:
       - avg_lifetime_rating: average rating across all films
@@ -12,50 +54,68 @@ def compute_actor_differences(actor_rating_shift: pd.DataFrame) -> pd.DataFrame:
 
     Tie-break rule when multiple films share the latest date:
       - pick the one with the higher rating; if still tied, pick lexicographically smaller film_title.
-    """
-    df = actor_rating_shift.copy()
 
+    use_jit=False forces the numpy.lexsort path even when numba is installed.
+    """
+    # No frame copy: only the columns that need converting are materialized, as locals
     # Ensure release_date is datetime
-    df["release_date"] = pd.to_datetime(df["release_date"])
-
-    # --- lifetime average across ALL films ---
-    lifetime_avg = (
-        df.groupby("actor_name", as_index=False)
-        .agg(avg_lifetime_rating=("film_rating", "mean"))
-    )
-
-    # --- pick exactly one "latest" film per actor with tie-breakers ---
-    # Sort so the desired "latest" row becomes the first row per actor
-    df_sorted = df.sort_values(
-        by=["actor_name", "release_date", "film_rating", "film_title"],
-        ascending=[True, False, False, True]   # latest date desc, higher rating first, then title asc
-    )
-    # Mark first row per actor as the "latest"
-    df_sorted["rn"] = df_sorted.groupby("actor_name").cumcount() + 1
-    latest_rows = df_sorted.loc[df_sorted["rn"] == 1, ["actor_name", "film_rating"]].copy()
-    latest_rows = latest_rows.rename(columns={"film_rating": "latest_rating"})
-
-    # --- previous films average (exclude the chosen latest row) ---
-    # To exclude exactly the chosen latest row, drop rn==1 from df_sorted before averaging
-    prev_df = df_sorted.loc[df_sorted["rn"] != 1, ["actor_name", "film_rating"]].copy()
-    prev_avg = (
-        prev_df.groupby("actor_name", as_index=False)
-        .agg(avg_previous_rating=("film_rating", "mean"))
-    )
-
-    # Merge pieces
-    out = latest_rows.merge(lifetime_avg, on="actor_name", how="left")
-    out = out.merge(prev_avg, on="actor_name", how="left")
-
-    # Single-film actors: avg_previous_rating is NaN -> set diff to 0,
-    # and per requirement: lifetime avg = only film’s rating (already true), latest = that rating (already true)
-    # Compute difference; if no previous, fill with 0
-    out["rating_difference"] = (out["latest_rating"] - out["avg_previous_rating"]).round(2)
-    out["rating_difference"] = out["rating_difference"].fillna(0.00)
-
-    # Nice ordering
-    out = out[["actor_name", "avg_lifetime_rating", "latest_rating", "rating_difference"]]
-    # Optional: sort by actor_name for readability
+    release_date = pd.to_datetime(actor_rating_shift["release_date"])
+    # Group on integer category codes instead of re-hashing the name strings on every pass
+    actor = actor_rating_shift["actor_name"].astype("category")
+
+    # One contiguous 1-D array per column (C order; a no-op copy when already contiguous).
+    # Every pass below walks each column row by row, so strided views taken out of a
+    # wider pandas block would turn sequential reads into cache misses.
+    actor_codes = np.ascontiguousarray(actor.cat.codes.to_numpy())
+    dates = np.ascontiguousarray(release_date.to_numpy().view("i8"))
+    ratings = np.ascontiguousarray(actor_rating_shift["film_rating"].to_numpy(dtype=np.float64))
+    # categories sorted -> codes preserve title order
+    title_codes = np.ascontiguousarray(pd.Categorical(actor_rating_shift["film_title"]).codes, dtype=np.int64)
+
+    if use_jit and _latest_and_sums_jit is not None:
+        # --- numba: lifetime sum / count and tie-broken latest rating in one fused pass ---
+        latest, sums, counts, seen = _latest_and_sums_jit(
+            actor_codes, dates, ratings, title_codes,
+            len(actor.cat.categories),
+        )
+        observed = np.flatnonzero(seen)
+        index = pd.CategoricalIndex(pd.Categorical.from_codes(observed, dtype=actor.dtype))
+        with np.errstate(invalid="ignore"):  # all-NaN actor: 0 / 0 -> NaN mean, as pandas gives
+            mean = sums[observed] / counts[observed]
+        stats = pd.DataFrame(
+            {"sum": sums[observed], "mean": mean, "count": counts[observed]},
+            index=index,
+        )
+        latest_rating = pd.Series(latest[observed], index=index)
+    else:
+        # --- lifetime sum / mean / count across ALL films, one pass ---
+        stats = actor_rating_shift["film_rating"].groupby(actor, observed=True, sort=False).agg(["sum", "mean", "count"])
+
+        # --- pick exactly one "latest" film per actor with tie-breakers ---
+        # np.lexsort on the raw arrays (last key is primary): actor asc, date desc,
+        # rating desc, title asc -> the desired "latest" row is the first row per actor
+        # Missing actor_name (code -1) is dropped first, as the groupby above drops NaN keys
+        keep = np.flatnonzero(actor_codes >= 0)
+        order = keep[np.lexsort((title_codes[keep], -ratings[keep], -dates[keep], actor_codes[keep]))]
+        latest_codes, first = np.unique(actor_codes[order], return_index=True)
+        latest_rating = pd.Series(
+            ratings[order][first],
+            index=pd.CategoricalIndex(pd.Categorical.from_codes(latest_codes, dtype=actor.dtype)),
+        )
+
+    # --- previous films average, derived algebraically (no second groupby / merge) ---
+    # Single-film actors have no previous films -> NaN -> difference filled with 0
+    prev_count = stats["count"] - 1
+    avg_previous_rating = (stats["sum"] - latest_rating) / prev_count.where(prev_count > 0)
+    rating_difference = (latest_rating - avg_previous_rating).round(2).fillna(0.00)
+
+    out = pd.DataFrame({
+        "avg_lifetime_rating": stats["mean"],
+        "latest_rating": latest_rating,
+        "rating_difference": rating_difference,
+    }).rename_axis("actor_name").reset_index()
+    # Back to the caller's dtype; sort by actor_name for readability
+    out["actor_name"] = out["actor_name"].astype(actor_rating_shift["actor_name"].dtype)
     out = out.sort_values("actor_name").reset_index(drop=True)
     return out
 
@@ -66,28 +126,45 @@ def build_test_data() -> pd.DataFrame:
       - Actors with multiple films
       - Single-film actor
       - Ties on latest date to exercise the tie-break rule
+      - Missing (NaN) ratings, including one on a latest-date tie
+      - A film with no actor_name, which is left out of every actor's figures
     """
-    data = [
-        # Actor A: clear increasing timeline
-        {"actor_name": "Alice Anders", "film_title": "Rising Dawn",     "release_date": "2018-05-10", "film_rating": 6.8},
-        {"actor_name": "Alice Anders", "film_title": "Silent Echoes",   "release_date": "2020-08-01", "film_rating": 7.5},
-        {"actor_name": "Alice Anders", "film_title": "Last Horizon",    "release_date": "2023-09-15", "film_rating": 8.9},
-
-        # Actor B: single film
-        {"actor_name": "Ben Brooks",   "film_title": "Lone Star",       "release_date": "2019-03-22", "film_rating": 6.2},
-
-        # Actor C: latest date tie; higher rating should win as latest
-        {"actor_name": "Cara Chen",    "film_title": "Neon River",      "release_date": "2021-02-11", "film_rating": 7.1},
-        {"actor_name": "Cara Chen",    "film_title": "Neon River II",   "release_date": "2024-11-09", "film_rating": 8.0},
-        {"actor_name": "Cara Chen",    "film_title": "Neon River III",  "release_date": "2024-11-09", "film_rating": 8.4},  # same date, higher rating
-        {"actor_name": "Cara Chen",    "film_title": "Neon Prelude",    "release_date": "2019-01-04", "film_rating": 6.5},
-
-        # Actor D: latest date tie with same rating; title tiebreak (alphabetical)
-        {"actor_name": "Diego Diaz",   "film_title": "Twin Skies",      "release_date": "2022-07-07", "film_rating": 7.9},
-        {"actor_name": "Diego Diaz",   "film_title": "Mirror Gate A",   "release_date": "2025-06-01", "film_rating": 8.3},
-        {"actor_name": "Diego Diaz",   "film_title": "Mirror Gate B",   "release_date": "2025-06-01", "film_rating": 8.3},  # same date & rating, 'A' beats 'B'
-    ]
-    return pd.DataFrame(data)
+    # Columnar (one typed array per column) rather than a list of row dicts,
+    # so pandas doesn't have to hash each row and infer dtypes
+    return pd.DataFrame({
+        "actor_name": pd.array([
+            "Alice Anders", "Alice Anders", "Alice Anders",               # Actor A: clear increasing timeline
+            "Ben Brooks",                                                 # Actor B: single film
+            "Cara Chen", "Cara Chen", "Cara Chen", "Cara Chen",           # Actor C: latest date tie; higher rating wins
+            "Diego Diaz", "Diego Diaz", "Diego Diaz",                     # Actor D: date & rating tie; title tiebreak
+            "Evan Ellis", "Evan Ellis", "Evan Ellis", "Evan Ellis",       # Actor E: unrated films are skipped
+            None,                                                         # no actor: not counted for anyone
+        ], dtype="string"),
+        "film_title": pd.array([
+            "Rising Dawn", "Silent Echoes", "Last Horizon",
+            "Lone Star",
+            "Neon River", "Neon River II", "Neon River III", "Neon Prelude",
+            "Twin Skies", "Mirror Gate A", "Mirror Gate B",               # 'A' beats 'B'
+            "Dust Road", "Dust Road II", "Aftermath", "Dust Road III",     # unrated 'Aftermath' loses the tie
+            "Zero Hour",
+        ], dtype="string"),
+        "release_date": pd.to_datetime([
+            "2018-05-10", "2020-08-01", "2023-09-15",
+            "2019-03-22",
+            "2021-02-11", "2024-11-09", "2024-11-09", "2019-01-04",       # same date for II / III
+            "2022-07-07", "2025-06-01", "2025-06-01",
+            "2017-04-02", "2020-10-30", "2022-12-16", "2022-12-16",
+            "2026-01-01",
+        ]),
+        "film_rating": np.array([
+            6.8, 7.5, 8.9,
+            6.2,
+            7.1, 8.0, 8.4, 6.5,                                           # III (8.4) beats II (8.0)
+            7.9, 8.3, 8.3,
+            5.0, np.nan, np.nan, 7.0,                                     # avg 6.0, latest 7.0, diff 2.0
+            9.9,
+        ], dtype="float64"),
+    })
 
 
 if __name__ == "__main__":
@@ -101,3 +178,7 @@ if __name__ == "__main__":
 
     result_df = compute_actor_differences(actor_rating_shift)
     print(result_df.to_string(index=False))
+
+    # The numba kernel must agree with the numpy.lexsort fallback, NaN ratings/actors included
+    if _latest_and_sums_jit is not None:
+        pd.testing.assert_frame_equal(result_df, compute_actor_differences(actor_rating_shift, use_jit=False))
@@ -1,13 +1,16 @@
 # main.py
+import io
 import os
+import csv
 import json
 import atexit
 import logging
 import datetime
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Tuple, Dict
 
 from flask import Request, make_response
-from sqlalchemy import create_engine, text, MetaData, Table, select, func
+from sqlalchemy import create_engine, text, bindparam
 
 from google.cloud.alloydb.connector import Connector, IPTypes
 from google.cloud import secretmanager
@@ -37,6 +40,9 @@ SOURCE_SYSTEM = os.environ.get("SOURCE_SYSTEM", "alloydb-cluster-a")
 
 SYSTEM_SCHEMAS = {"pg_catalog", "information_schema", "pg_toast"}
 
+# Parallel COUNT(*) batches in exact mode; keep <= pool_size - 1 (main() holds one connection)
+COUNT_WORKERS = int(os.environ.get("COUNT_WORKERS", "4"))
+
 # ──────────────────────────────────────────────────────────────────────────────
 # Connector, Secret Manager, SQLAlchemy engine
 # ──────────────────────────────────────────────────────────────────────────────
@@ -60,6 +66,13 @@ def _db_password() -> str:
         return _get_secret_payload(SECRET_RESOURCE)
     raise RuntimeError("No DB password provided. Set DB_PASS or SECRET_RESOURCE, or enable IAM_AUTH=true.")
 
+# Resolved once per instance: a misconfigured deploy fails at cold start, not on every new connection
+try:
+    _RESOLVED_PASSWORD = None if IAM_AUTH else _db_password()
+except Exception:
+    logging.exception("could not resolve DB password")
+    raise
+
 def _getconn():
     ip = IPTypes.PRIVATE if IP_TYPE == "PRIVATE" else IPTypes.PUBLIC
     if IAM_AUTH:
@@ -77,7 +90,7 @@ def _getconn():
             INSTANCE_URI,
             "pg8000",
             user=DB_USER,
-            password=_db_password(),
+            password=_RESOLVED_PASSWORD,
             db=DB_NAME,
             ip_type=ip,
         )
@@ -91,7 +104,6 @@ engine = create_engine(
     pool_size=5,
     max_overflow=5,
 )
-metadata = MetaData()
 
 # Close connector when the instance is torn down
 atexit.register(lambda: _connector.close())
@@ -134,10 +146,11 @@ def list_all_user_tables(conn, exclude: set) -> List[Tuple[str, str]]:
             SELECT table_schema, table_name
             FROM information_schema.tables
             WHERE table_type='BASE TABLE'
-              AND table_schema NOT IN ('pg_catalog','information_schema','pg_toast')
-        """)
+              AND table_schema NOT IN :exclude
+        """).bindparams(bindparam("exclude", expanding=True)),
+        {"exclude": list(SYSTEM_SCHEMAS | exclude)},
     ).all()
-    return [(r.table_schema, r.table_name) for r in rows if r.table_schema not in exclude]
+    return [(r.table_schema, r.table_name) for r in rows]
 
 def list_from_payload(tables: List[str], exclude: set) -> List[Tuple[str, str]]:
     out = []
@@ -152,75 +165,167 @@ def list_from_payload(tables: List[str], exclude: set) -> List[Tuple[str, str]]:
 # ──────────────────────────────────────────────────────────────────────────────
 # Sizes + counts
 # ──────────────────────────────────────────────────────────────────────────────
-def get_sizes(conn, schema: str, table: str) -> Tuple[int, int, int]:
-    row = conn.execute(
+def get_sizes_many(conn, targets: List[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple[int, int, int]]:
+    if not targets:
+        return {}
+    rows = conn.execute(
         text("""
             SELECT
+              n.nspname                             AS schema_name,
+              c.relname                             AS table_name,
               pg_total_relation_size(c.oid)::bigint AS bytes_total,
               pg_relation_size(c.oid)::bigint       AS bytes_table,
               pg_indexes_size(c.oid)::bigint        AS bytes_index
             FROM pg_class c
             JOIN pg_namespace n ON n.oid = c.relnamespace
-            WHERE n.nspname = :schema AND c.relname = :table
-              AND c.relkind = 'r'
+            WHERE c.relkind = 'r'
+              AND (n.nspname, c.relname) IN (
+                SELECT * FROM unnest(CAST(:schemas AS text[]), CAST(:tables AS text[]))
+              )
         """),
-        {"schema": schema, "table": table},
-    ).one_or_none()
-    return (row.bytes_total, row.bytes_table, row.bytes_index) if row else (0, 0, 0)
-
-_reflect_cache: Dict[Tuple[str, str], Table] = {}
-
-def _reflect_table(schema: str, table: str) -> Table:
-    key = (schema, table)
-    t = _reflect_cache.get(key)
-    if t is None:
-        t = Table(table, metadata, schema=schema, autoload_with=engine)
-        _reflect_cache[key] = t
-    return t
-
-def count_exact(conn, schema: str, table: str) -> int:
-    t = _reflect_table(schema, table)
-    return conn.execute(select(func.count()).select_from(t)).scalar_one()
-
-def count_approx(conn, schema: str, table: str) -> int:
-    row = conn.execute(
+        {"schemas": [s for s, _ in targets], "tables": [t for _, t in targets]},
+    ).all()
+    return {
+        (r.schema_name, r.table_name): (r.bytes_total, r.bytes_table, r.bytes_index)
+        for r in rows
+    }
+
+# Tables per UNION ALL statement in count_exact_many (keeps statements well under parser limits)
+COUNT_BATCH_SIZE = 50
+# Above this many snapshot rows, load through COPY instead of one bound VALUES list
+# (6 binds/row + 2 shared: 3002 binds at the threshold, well under the 65535 bind limit)
+SNAPSHOT_COPY_THRESHOLD = 500
+
+def _qi(ident: str) -> str:
+    return '"' + ident.replace('"', '""') + '"'
+
+def _exec_count_sql(conn, sql: str):
+    # Count SQL is rebuilt per table set and has no binds: hand it straight to the driver,
+    # skipping sa.text() compilation / statement-cache keying and DBAPI paramstyle rewriting.
+    # Per-statement options: Connection.execution_options() would stick to the caller's `conn`.
+    return conn.exec_driver_sql(sql, execution_options={"no_parameters": True})
+
+def _count_batch(conn, chunk: List[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    sql = " UNION ALL ".join(
+        f"SELECT {i} AS i, count(*) AS c FROM {_qi(s)}.{_qi(t)}"
+        for i, (s, t) in enumerate(chunk)
+    )
+    return {chunk[r.i]: int(r.c) for r in _exec_count_sql(conn, sql).all()}
+
+def _count_batch_pooled(chunk: List[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    with engine.connect() as conn:
+        return _count_batch(conn, chunk)
+
+def count_exact_many(conn, targets: List[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    """
+    Exact counts for many tables, COUNT_BATCH_SIZE tables per round-trip:
+      SELECT 0 AS i, count(*) AS c FROM "s1"."t1" UNION ALL SELECT 1, count(*) FROM "s2"."t2" ...
+    With more than one batch and COUNT_WORKERS > 1, batches run concurrently on their own
+    pooled connections. Those counts come from separate snapshots, not `conn`'s transaction.
+    """
+    chunks = [targets[i:i + COUNT_BATCH_SIZE] for i in range(0, len(targets), COUNT_BATCH_SIZE)]
+    counts: Dict[Tuple[str, str], int] = {}
+    if COUNT_WORKERS <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            counts.update(_count_batch(conn, chunk))
+        return counts
+    with ThreadPoolExecutor(max_workers=COUNT_WORKERS) as pool:
+        for part in pool.map(_count_batch_pooled, chunks):
+            counts.update(part)
+    return counts
+
+def count_approx_many(conn, targets: List[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    if not targets:
+        return {}
+    rows = conn.execute(
         text("""
-            SELECT COALESCE(n_live_tup, 0)::bigint AS est
+            SELECT schemaname, relname, COALESCE(n_live_tup, 0)::bigint AS est
             FROM pg_stat_user_tables
-            WHERE schemaname = :schema AND relname = :table
+            WHERE (schemaname, relname) IN (
+              SELECT * FROM unnest(CAST(:schemas AS text[]), CAST(:tables AS text[]))
+            )
+        """),
+        {"schemas": [s for s, _ in targets], "tables": [t for _, t in targets]},
+    ).all()
+    return {(r.schemaname, r.relname): int(r.est) for r in rows}
+
+_SNAPSHOT_COLUMNS = """
+    run_id, snapshot_ts, db_name, schema_name, table_name,
+    row_count, bytes_total, bytes_table, bytes_index, extra
+"""
+_SNAPSHOT_ON_CONFLICT = """
+    ON CONFLICT (schema_name, table_name, snapshot_date)
+    DO UPDATE SET
+      run_id      = EXCLUDED.run_id,
+      row_count   = EXCLUDED.row_count,
+      bytes_total = EXCLUDED.bytes_total,
+      bytes_table = EXCLUDED.bytes_table,
+      bytes_index = EXCLUDED.bytes_index,
+      snapshot_ts = EXCLUDED.snapshot_ts
+"""
+
+def _copy_snapshots(conn, run_id: int, ts: datetime.datetime, items) -> None:
+    """COPY rows into a transaction-scoped staging table, then upsert them in one INSERT ... SELECT."""
+    buf = io.StringIO()
+    csv.writer(buf).writerows(
+        (schema, table, int(rc), int(btot), int(btab), int(bidx))
+        for (schema, table), (rc, (btot, btab, bidx)) in items
+    )
+    buf.seek(0)
+    conn.execute(text("""
+        CREATE TEMP TABLE rowcount_snapshot_stage (
+          schema_name text, table_name text, row_count bigint,
+          bytes_total bigint, bytes_table bigint, bytes_index bigint
+        ) ON COMMIT DROP
+    """))
+    cur = conn.connection.cursor()  # same DBAPI connection / transaction as conn
+    try:
+        cur.execute("COPY rowcount_snapshot_stage FROM STDIN WITH (FORMAT csv)", stream=buf)  # pg8000
+    finally:
+        cur.close()
+    conn.execute(
+        text(f"""
+            INSERT INTO ops.rowcount_snapshot ({_SNAPSHOT_COLUMNS})
+            SELECT :run_id, :ts, current_database(), schema_name, table_name,
+                   row_count, bytes_total, bytes_table, bytes_index, '{{}}'::jsonb
+            FROM rowcount_snapshot_stage
+            {_SNAPSHOT_ON_CONFLICT}
         """),
-        {"schema": schema, "table": table},
-    ).one_or_none()
-    return int(row.est) if row else 0
-
-def upsert_snapshot(conn, run_id: int, ts: datetime.datetime,
-                    schema: str, table: str, row_count: int,
-                    sizes: Tuple[int, int, int]):
-    bytes_total, bytes_table, bytes_index = sizes
+        {"run_id": run_id, "ts": ts},
+    )
+
+def upsert_snapshots(conn, run_id: int, ts: datetime.datetime,
+                     rows: List[Tuple[str, str, int, Tuple[int, int, int]]]):
+    """
+    rows: list[(schema, table, row_count, (bytes_total, bytes_table, bytes_index))]
+    Written as one multi-row INSERT ... ON CONFLICT, or via COPY + INSERT ... SELECT
+    above SNAPSHOT_COPY_THRESHOLD rows.
+    """
+    # ON CONFLICT DO UPDATE can't touch the same row twice in one statement
+    unique = {(schema, table): (rc, sizes) for (schema, table, rc, sizes) in rows}
+    items = list(unique.items())
+    if len(items) > SNAPSHOT_COPY_THRESHOLD:
+        _copy_snapshots(conn, run_id, ts, items)
+        return
+    if not items:
+        return
+    values, params = [], {"run_id": run_id, "ts": ts}
+    for i, ((schema, table), (rc, (btot, btab, bidx))) in enumerate(items):
+        values.append(
+            f"(:run_id, :ts, current_database(), :s{i}, :t{i}, "
+            f":rc{i}, :btot{i}, :btab{i}, :bidx{i}, '{{}}'::jsonb)"
+        )
+        params.update({
+            f"s{i}": schema, f"t{i}": table, f"rc{i}": int(rc),
+            f"btot{i}": int(btot), f"btab{i}": int(btab), f"bidx{i}": int(bidx),
+        })
     conn.execute(
-        text("""
-            INSERT INTO ops.rowcount_snapshot (
-              run_id, snapshot_ts, db_name, schema_name, table_name,
-              row_count, bytes_total, bytes_table, bytes_index, extra
-            )
-            VALUES (
-              :run_id, :ts, current_database(), :schema, :table,
-              :rc, :btot, :btab, :bidx, '{}'::jsonb
-            )
-            ON CONFLICT (schema_name, table_name, snapshot_date)
-            DO UPDATE SET
-              run_id      = EXCLUDED.run_id,
-              row_count   = EXCLUDED.row_count,
-              bytes_total = EXCLUDED.bytes_total,
-              bytes_table = EXCLUDED.bytes_table,
-              bytes_index = EXCLUDED.bytes_index,
-              snapshot_ts = EXCLUDED.snapshot_ts
+        text(f"""
+            INSERT INTO ops.rowcount_snapshot ({_SNAPSHOT_COLUMNS})
+            VALUES {", ".join(values)}
+            {_SNAPSHOT_ON_CONFLICT}
         """),
-        {
-            "run_id": run_id, "ts": ts, "schema": schema, "table": table,
-            "rc": int(row_count), "btot": int(bytes_total),
-            "btab": int(bytes_table), "bidx": int(bytes_index),
-        },
+        params,
     )
 
 # ──────────────────────────────────────────────────────────────────────────────
@@ -258,12 +363,16 @@ def main(request: Request):
             else:
                 raise ValueError(f"Unknown mode: {mode}")
 
-            processed = 0
-            for (schema, table) in targets:
-                rc = count_exact(conn, schema, table) if exact else count_approx(conn, schema, table)
-                sizes = get_sizes(conn, schema, table)
-                upsert_snapshot(conn, run_id, ts, schema, table, rc, sizes)
-                processed += 1
+            counts = count_exact_many(conn, targets) if exact else count_approx_many(conn, targets)
+            sizes_by_pair = get_sizes_many(conn, targets)
+
+            snapshots = [
+                (schema, table, counts.get((schema, table), 0),
+                 sizes_by_pair.get((schema, table), (0, 0, 0)))
+                for (schema, table) in targets
+            ]
+            upsert_snapshots(conn, run_id, ts, snapshots)
+            processed = len(snapshots)
 
             update_run_status(conn, run_id, "SUCCEEDED")
 
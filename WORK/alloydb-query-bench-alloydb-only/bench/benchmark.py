@@ -1,49 +1,104 @@
 
 from __future__ import annotations
 import time, json, os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
-from typing import Any
-import pandas as pd
+from typing import Any, TYPE_CHECKING
 import yaml
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from .db import build_engine, apply_session_settings
 
+if TYPE_CHECKING:
+    import pandas as pd
+
+try:
+    from yaml import CSafeLoader as _YLoader  # libyaml C parser
+except ImportError:
+    from yaml import SafeLoader as _YLoader
+
+try:
+    from orjson import loads as _json_loads  # C parser for (large) EXPLAIN payloads
+except ImportError:
+    _json_loads = json.loads
+
 @dataclass
 class RunSpec:
     repeats: int = 5
     warmups: int = 2
     statement_timeout_ms: int = 60000
     default_session: dict | None = None
+    measure_mode: str = "explain"  # "explain": one EXPLAIN ANALYZE per repeat; "wall": plain run + EXPLAIN
+    parallel: int = 1  # queries benchmarked concurrently, each on its own pooled connection
+
+# Column dtypes of the per-run results frame; nullable dtypes keep None as <NA> without object columns
+_RESULT_DTYPES = {
+    "query_name": object, "run_index": "int64",
+    "wall_ms": "Float64", "rows": "Int64",
+    "plan_ms": "Float64", "exec_ms": "Float64",
+    "shared_hit": "Int64", "shared_read": "Int64",
+    "temp_read": "Int64", "temp_write": "Int64",
+    "error": object,
+}
 
 def _load_sql(file_path: str) -> str:
     with open(file_path, "r", encoding="utf-8") as f:
         return f.read()
 
-def load_config(path: str) -> tuple[RunSpec, list[dict]]:
+def _read_config(path: str) -> dict:
+    # Parsed YAML is cached as JSON next to the config, keyed by mtime+size; JSON loads far faster
+    st = os.stat(path)
+    key = f"{st.st_mtime_ns}:{st.st_size}"
+    sidecar = path + ".cache.json"
+    try:
+        with open(sidecar, "r", encoding="utf-8") as f:
+            cached = json.load(f)
+        if cached.get("key") == key:
+            return cached["cfg"]
+    except (OSError, ValueError):
+        pass
     with open(path, "r", encoding="utf-8") as f:
-        cfg = yaml.safe_load(f)
+        cfg = yaml.load(f, Loader=_YLoader) or {}
+    tmp = f"{sidecar}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"key": key, "cfg": cfg}, f)
+        os.replace(tmp, sidecar)
+    except (OSError, TypeError):  # read-only dir, or YAML values JSON can't represent (e.g. dates)
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+    return cfg
+
+def load_config(path: str) -> tuple[RunSpec, list[dict]]:
+    cfg = _read_config(path)
     run = cfg.get("run", {}) or {}
     spec = RunSpec(
         repeats=int(run.get("repeats", 5)),
         warmups=int(run.get("warmups", 2)),
         statement_timeout_ms=int(run.get("statement_timeout_ms", 60000)),
-        default_session=run.get("default_session")
+        default_session=run.get("default_session"),
+        measure_mode=str(run.get("measure_mode", "explain")),
+        parallel=int(run.get("parallel", 1)),
     )
+    if spec.measure_mode not in ("explain", "wall"):
+        raise ValueError("run.measure_mode must be 'explain' or 'wall'")
+    if spec.parallel < 1:
+        raise ValueError("run.parallel must be >= 1")
     queries = cfg.get("queries", [])
     if not isinstance(queries, list) or not queries:
         raise ValueError("config must include a non-empty 'queries' list")
     return spec, queries
 
-def _explain_json(conn, sql: str, params: dict | None) -> dict | None:
-    e = text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
-    r = conn.execute(e, params or {}).fetchone()
+def _explain_json(conn, explain_stmt, params: dict | None) -> dict | None:
+    r = conn.execute(explain_stmt, params or {}).fetchone()
     if not r:
         return None
     payload = r[0]
     if isinstance(payload, str):
         try:
-            return json.loads(payload)[0]
+            return _json_loads(payload)[0]
         except Exception:
             return None
     if isinstance(payload, list):
@@ -56,94 +111,131 @@ def _extract_explain_metrics(explain: dict | None) -> dict:
     plan = explain.get("Plan", {})
     planning = explain.get("Planning Time", None)
     exec_ms = plan.get("Actual Total Time", None)
-    def walk_buffers(node):
-        res = {"shared_hit":0,"shared_read":0,"temp_read":0,"temp_write":0}
-        if not isinstance(node, dict):
-            return res
-        res["shared_hit"] += node.get("Shared Hit Blocks", 0) or 0
-        res["shared_read"] += node.get("Shared Read Blocks", 0) or 0
-        res["temp_read"] += node.get("Temp Read Blocks", 0) or 0
-        res["temp_write"] += node.get("Temp Written Blocks", 0) or 0
-        for sub in node.get("Plans", []) or []:
-            child = walk_buffers(sub)
-            for k in res:
-                res[k] += child[k]
-        return res
-    buf_totals = walk_buffers(plan)
+    # EXPLAIN already rolls buffer counts up the tree: a node's numbers include all
+    # of its children, so the root carries the statement totals and no walk is needed
+    buf_totals = {
+        "shared_hit": plan.get("Shared Hit Blocks", 0) or 0,
+        "shared_read": plan.get("Shared Read Blocks", 0) or 0,
+        "temp_read": plan.get("Temp Read Blocks", 0) or 0,
+        "temp_write": plan.get("Temp Written Blocks", 0) or 0,
+    }
     return {
         "plan_ms": planning,
         "exec_ms": exec_ms,
         **buf_totals
     }
 
-def _maybe_set_timeout(conn, ms: int):
-    conn.execute(text("SET statement_timeout = :ms"), {"ms": ms})
+_set_stmts: dict = {}
 
-def _maybe_apply_session(conn, default_session: dict | None, session: dict | None):
-    if default_session:
-        for k, v in default_session.items():
-            conn.execute(text(f"SET {k} = :v"), {"v": v})
-    if session:
-        for k, v in session.items():
-            conn.execute(text(f"SET {k} = :v"), {"v": v})
+def _set_stmt(n: int):
+    # set_config() takes name and value as binds, so one statement per setting count is enough
+    stmt = _set_stmts.get(n)
+    if stmt is None:
+        cols = ", ".join(f"set_config(:k{i}, :v{i}, false)" for i in range(n))
+        stmt = _set_stmts[n] = text(f"SELECT {cols}")
+    return stmt
+
+def _guc_value(v) -> str:
+    if isinstance(v, bool):
+        return "on" if v else "off"
+    return str(v)
+
+def _apply_session(conn, statement_timeout_ms: int, default_session: dict | None, session: dict | None):
+    # statement_timeout + global SETs + per-query overrides, applied in one round trip
+    settings = {"statement_timeout": statement_timeout_ms, **(default_session or {}), **(session or {})}
+    params = {}
+    for i, (k, v) in enumerate(settings.items()):
+        params[f"k{i}"] = k
+        params[f"v{i}"] = _guc_value(v)
+    conn.execute(_set_stmt(len(settings)), params).fetchall()
+
+def _bench_one(engine: Engine, spec: RunSpec, q: dict) -> list[dict]:
+    name = q.get("name") or "unnamed"
+    sql = q.get("sql")
+    file = q.get("file")
+    params = q.get("params") or {}
+    session = q.get("session") or {}
+
+    if file and not sql:
+        sql = _load_sql(file)
+    if not sql:
+        raise ValueError(f"Query '{name}' must have either 'sql' or 'file'.")
+
+    stmt = text(sql)
+    explain_stmt = text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
 
-def run_bench(config_path: str, out_dir: str = "out"):
-    spec, queries = load_config(config_path)
-    engine: Engine = build_engine()
     rows = []
-    os.makedirs(out_dir, exist_ok=True)
     with engine.connect() as conn:
-        _maybe_set_timeout(conn, spec.statement_timeout_ms)
-        for q in queries:
-            name = q.get("name") or "unnamed"
-            sql = q.get("sql")
-            file = q.get("file")
-            params = q.get("params") or {}
-            session = q.get("session") or {}
-
-            if file and not sql:
-                sql = _load_sql(file)
-            if not sql:
-                raise ValueError(f"Query '{name}' must have either 'sql' or 'file'.")
-
-            _maybe_apply_session(conn, spec.default_session, session)
-
-            for _ in range(spec.warmups):
-                try:
-                    conn.execute(text(sql), params).fetchall()
-                except Exception:
-                    pass
-
-            for i in range(spec.repeats):
-                rec = {
-                    "query_name": name, "run_index": i,
-                    "wall_ms": None, "rows": None,
-                    "plan_ms": None, "exec_ms": None,
-                    "shared_hit": None, "shared_read": None,
-                    "temp_read": None, "temp_write": None,
-                    "error": None
-                }
-                try:
+        _apply_session(conn, spec.statement_timeout_ms, spec.default_session, session)
+
+        for _ in range(spec.warmups):
+            try:
+                conn.execute(stmt, params).fetchall()
+            except Exception:
+                pass
+
+        for i in range(spec.repeats):
+            rec = {
+                "query_name": name, "run_index": i,
+                "wall_ms": None, "rows": None,
+                "plan_ms": None, "exec_ms": None,
+                "shared_hit": None, "shared_read": None,
+                "temp_read": None, "temp_write": None,
+                "error": None
+            }
+            try:
+                if spec.measure_mode == "wall":
                     t0 = time.perf_counter()
-                    res = conn.execute(text(sql), params)
+                    res = conn.execute(stmt, params)
                     data = res.fetchall()
                     t1 = time.perf_counter()
                     rec["wall_ms"] = (t1 - t0) * 1000.0
                     rec["rows"] = len(data)
-                    explain = _explain_json(conn, sql, params)
-                    em = _extract_explain_metrics(explain)
-                    rec.update({k: em.get(k) for k in ["plan_ms","exec_ms","shared_hit","shared_read","temp_read","temp_write"]})
-                except Exception as e:
-                    rec["error"] = str(e)
-                rows.append(rec)
-
-    df = pd.DataFrame(rows)
-    agg = df.groupby("query_name", dropna=False).agg(
+                explain = _explain_json(conn, explain_stmt, params)
+                em = _extract_explain_metrics(explain)
+                rec.update({k: em.get(k) for k in ["plan_ms","exec_ms","shared_hit","shared_read","temp_read","temp_write"]})
+                if spec.measure_mode == "explain" and explain:
+                    # Server-side time from the single EXPLAIN ANALYZE run (excludes network/fetch)
+                    if em.get("plan_ms") is not None and em.get("exec_ms") is not None:
+                        rec["wall_ms"] = em["plan_ms"] + em["exec_ms"]
+                    rec["rows"] = explain.get("Plan", {}).get("Actual Rows")
+            except Exception as e:
+                rec["error"] = str(e)
+            rows.append(rec)
+    return rows
+
+def run_bench(config_path: str, out_dir: str = "out", parallel: int | None = None):
+    import pandas as pd  # heavy; only needed here, so load_config/etc. stay cheap to import
+    spec, queries = load_config(config_path)
+    if parallel is not None:
+        if parallel < 1:
+            raise ValueError("parallel must be >= 1")
+        spec.parallel = parallel
+    # One pooled connection per concurrent query; a smaller pool would make threads queue on
+    # QueuePool's checkout timeout and fail the run
+    engine: Engine = build_engine(pool_size=max(5, spec.parallel))
+    os.makedirs(out_dir, exist_ok=True)
+    if spec.parallel == 1 or len(queries) == 1:
+        results = [_bench_one(engine, spec, q) for q in queries]
+    else:
+        # Independent queries overlap their round trips; keep config order in the output
+        results = [None] * len(queries)
+        with ThreadPoolExecutor(max_workers=spec.parallel) as ex:
+            futures = {ex.submit(_bench_one, engine, spec, q): i for i, q in enumerate(queries)}
+            for fut in as_completed(futures):
+                results[futures[fut]] = fut.result()
+    rows = [rec for recs in results for rec in recs]
+
+    df = pd.DataFrame({
+        c: pd.array([r[c] for r in rows], dtype=dt) for c, dt in _RESULT_DTYPES.items()
+    })
+    # Built-in aggregations only (no lambdas) so every column stays on pandas' Cython paths
+    g = df.assign(_ok=df["error"].isna() | (df["error"] == "")).groupby("query_name", dropna=False)
+    agg = g.agg(
         runs=("wall_ms","count"),
-        ok_runs=("error", lambda s: int((s.isna() | (s == "")).sum())),
+        ok_runs=("_ok","sum"),
         wall_ms_mean=("wall_ms","mean"),
         wall_ms_median=("wall_ms","median"),
-        wall_ms_p95=("wall_ms", lambda s: float(s.quantile(0.95)) if s.notna().any() else None),
         wall_ms_std=("wall_ms","std"),
         rows_mean=("rows","mean"),
         plan_ms_mean=("plan_ms","mean"),
@@ -152,5 +244,7 @@ def run_bench(config_path: str, out_dir: str = "out"):
         shared_read_sum=("shared_read","sum"),
         temp_read_sum=("temp_read","sum"),
         temp_write_sum=("temp_write","sum"),
-    ).reset_index()
+    )
+    agg.insert(agg.columns.get_loc("wall_ms_std"), "wall_ms_p95", g["wall_ms"].quantile(0.95))
+    agg = agg.reset_index()
     return df, agg
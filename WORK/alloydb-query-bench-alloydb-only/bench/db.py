@@ -3,7 +3,7 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.engine import Engine
 import os
 
-def build_engine() -> Engine:
+def build_engine(pre_ping: bool = False, pool_size: int = 5) -> Engine:
     host = os.getenv("PG_HOST", "127.0.0.1")
     port = os.getenv("PG_PORT", "5432")
     db   = os.getenv("PG_DB", "postgres")
@@ -27,7 +27,9 @@ def build_engine() -> Engine:
     # Build DSN via query string
     url_params = "&".join([f"{k}={v}" for k,v in params.items()])
     url = f"postgresql+psycopg2:///?{url_params}"
-    engine = create_engine(url, pool_pre_ping=True, pool_size=5, max_overflow=5)
+    # pre_ping costs a SELECT 1 per checkout; bench connections are short-lived and used at once
+    # pool_size: at least as many as the bench runs concurrently, so no checkout waits on the pool
+    engine = create_engine(url, pool_pre_ping=pre_ping, pool_size=pool_size, max_overflow=5)
     return engine
 
 def apply_session_settings(conn, settings: dict | None):
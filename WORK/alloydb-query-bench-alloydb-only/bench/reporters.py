@@ -1,13 +1,21 @@
 
 from __future__ import annotations
 import os
-import pandas as pd
-from tabulate import tabulate
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:  # pandas is imported where used, keeping `import bench.reporters` cheap
+    import pandas as pd
 
 def write_csv(df: pd.DataFrame, out_dir: str, ts: str) -> str:
     os.makedirs(out_dir, exist_ok=True)
     path = os.path.join(out_dir, f"benchmark_results_{ts}.csv")
-    df.to_csv(path, index=False)
+    try:
+        import pyarrow as pa, pyarrow.csv as pc  # C writer; heavy, so only imported here
+    except ImportError:
+        df.to_csv(path, index=False)
+        return path
+    pc.write_csv(pa.Table.from_pandas(df, preserve_index=False), path,
+                 write_options=pc.WriteOptions(quoting_style="needed"))
     return path
 
 def write_markdown(df: pd.DataFrame, out_dir: str, ts: str) -> str:
@@ -18,12 +26,21 @@ def write_markdown(df: pd.DataFrame, out_dir: str, ts: str) -> str:
         "shared_hit","shared_read","temp_read","temp_write","error"
     ]
     subset = df[cols] if set(cols).issubset(df.columns) else df
+    # GitHub table written directly; missing values render empty, '|'/newlines can't break rows
+    cells = subset.astype(object).where(subset.notna(), "")
+    def _cell(v) -> str:
+        return str(v).replace("|", "\\|").replace("\n", " ")
     with open(path, "w", encoding="utf-8") as f:
         f.write("# Benchmark Summary\n\n")
-        f.write(tabulate(subset, headers="keys", tablefmt="github", showindex=False))
-        f.write("\n")
+        f.write("| " + " | ".join(map(str, subset.columns)) + " |\n")
+        f.write("|" + "|".join("---" for _ in subset.columns) + "|\n")
+        for row in cells.itertuples(index=False, name=None):
+            f.write("| " + " | ".join(map(_cell, row)) + " |\n")
     return path
 
+_GSHEET_MAX_CELLS = 50_000  # single update below this many cells
+_GSHEET_PAGE_ROWS = 5_000   # rows per update above it
+
 def write_gsheet(df: pd.DataFrame, sheet_id: str, tab_name: str):
     try:
         import gspread
@@ -35,8 +52,16 @@ def write_gsheet(df: pd.DataFrame, sheet_id: str, tab_name: str):
             sh.del_worksheet(ws)
         except Exception:
             pass
-        ws = sh.add_worksheet(title=tab_name, rows="100", cols="26")
-        ws.update([df.columns.tolist()] + df.values.tolist())
+        # One conversion pass; <NA>/NaN become null (empty cell) instead of breaking JSON encoding
+        values = [df.columns.tolist()] + df.astype(object).where(df.notna(), None).values.tolist()
+        ws = sh.add_worksheet(title=tab_name, rows=len(values), cols=max(len(df.columns), 1))
+        # RAW skips Sheets' input parsing; large frames go up in row pages to stay under request limits
+        if len(values) * len(df.columns) <= _GSHEET_MAX_CELLS:
+            ws.update(values=values, range_name="A1", value_input_option="RAW")
+        else:
+            for start in range(0, len(values), _GSHEET_PAGE_ROWS):
+                ws.update(values=values[start:start + _GSHEET_PAGE_ROWS],
+                          range_name=f"A{start + 1}", value_input_option="RAW")
         return True, None
     except Exception as e:
         return False, str(e)
@@ -8,10 +8,11 @@ def main():
     ap = argparse.ArgumentParser(description="AlloyDB/Postgres Query Benchmarker (AlloyDB-only)")
     ap.add_argument("--config", required=True, help="Path to YAML config")
     ap.add_argument("--out_dir", default="out", help="Output directory")
+    ap.add_argument("--parallel", type=int, default=None, help="Benchmark N queries concurrently (overrides run.parallel)")
     args = ap.parse_args()
 
     ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-    df, agg = run_bench(args.config, out_dir=args.out_dir)
+    df, agg = run_bench(args.config, out_dir=args.out_dir, parallel=args.parallel)
 
     detail_csv = write_csv(df, args.out_dir, ts)
     agg_csv = os.path.join(args.out_dir, f"benchmark_aggregates_{ts}.csv")
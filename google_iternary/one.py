@@ -1,9 +1,10 @@
-import os, atexit, json, base64, logging, datetime
+import os, atexit, json, base64, logging, datetime, time
+from concurrent.futures import ThreadPoolExecutor
 from zoneinfo import ZoneInfo
 from typing import Dict, List, Tuple, Optional
 
 from cloudevents.http import CloudEvent                     # CloudEvent signature
-from sqlalchemy import create_engine, text, MetaData, Table, select, func
+from sqlalchemy import create_engine, text, bindparam
 from google.cloud.alloydb.connector import Connector, IPTypes
 from google.cloud import secretmanager
 
@@ -20,24 +21,41 @@ IAM_AUTH        = os.environ.get("IAM_AUTH", "false").lower() == "true"
 IP_TYPE         = os.environ.get("IP_TYPE", "PRIVATE").upper()     # PRIVATE | PUBLIC
 
 SNAPSHOT_TZ     = os.environ.get("SNAPSHOT_TZ", "America/New_York") # business day
+_TZ             = ZoneInfo(SNAPSHOT_TZ)
 
-SYSTEM_SCHEMAS  = {"pg_catalog", "information_schema", "pg_toast"}
+SYSTEM_SCHEMAS  = frozenset({"pg_catalog", "information_schema", "pg_toast"})
+COUNT_BATCH_SIZE = 100                                             # tables per UNION ALL count round trip
+COUNT_WORKERS   = int(os.environ.get("COUNT_WORKERS", "4"))        # parallel count batches; <= pool_size - 1
+TABLES_CACHE_TTL_S = float(os.environ.get("TABLES_CACHE_TTL_S", "60"))  # warm-instance table listing reuse
+SECRET_CACHE_TTL_S = float(os.environ.get("SECRET_CACHE_TTL_S", "3600"))  # re-read secrets (rotation)
+SECRET_ERROR_TTL_S = float(os.environ.get("SECRET_ERROR_TTL_S", "10"))    # replay a failed lookup this long
 
 # ─────────────────────────────
 # Connector + SQLAlchemy engine
 # ─────────────────────────────
 _connector = Connector()
 _secret_client = secretmanager.SecretManagerServiceClient()
-_secret_cache: Dict[str, str] = {}
-metadata = MetaData()
+# resource -> (monotonic expiry, secret value, None) or (expiry, error message, original error)
+_secret_cache: Dict[str, Tuple[float, str, Optional[Exception]]] = {}
 
 def _get_secret_payload(res: str) -> str:
     if not res:
         return ""
-    if res in _secret_cache:
-        return _secret_cache[res]
-    val = _secret_client.access_secret_version(name=res).payload.data.decode("utf-8")
-    _secret_cache[res] = val
+    now = time.monotonic()
+    cached = _secret_cache.get(res)
+    if cached is not None and now < cached[0]:
+        _, val, err = cached
+        if err is not None:
+            # pool retries during an outage don't each hit Secret Manager; a fresh exception per
+            # raise, so threads never share (and keep extending) one traceback
+            raise RuntimeError(val) from err
+        return val
+    try:
+        val = _secret_client.access_secret_version(name=res).payload.data.decode("utf-8")
+    except Exception as e:
+        _secret_cache[res] = (now + SECRET_ERROR_TTL_S, f"secret lookup failed recently: {e}", e)
+        raise
+    _secret_cache[res] = (now + SECRET_CACHE_TTL_S, val, None)
     return val
 
 def _db_password() -> str:
@@ -69,44 +87,149 @@ atexit.register(lambda: _connector.close())
 # ─────────────────────────────
 # Helpers
 # ─────────────────────────────
-_reflect_cache: Dict[Tuple[str, str], Table] = {}
+try:
+    import orjson
+
+    _json_loads = orjson.loads  # accepts bytes directly
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:  # orjson is optional; stdlib json gives identical compact output
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+# (monotonic time, exclude set, tables) from the last listing; reused while fresh
+_tables_cache: Optional[Tuple[float, frozenset, List[Tuple[str, str]]]] = None
+
+def _invalidate_tables_cache() -> None:
+    global _tables_cache
+    _tables_cache = None
 
-def _reflect(schema: str, table: str) -> Table:
-    key = (schema, table)
-    t = _reflect_cache.get(key)
-    if t is None:
-        t = Table(table, metadata, schema=schema, autoload_with=engine)
-        _reflect_cache[key] = t
-    return t
+# pg_class directly, not the information_schema.tables view: ordinary/partitioned, non-temp
+# tables the caller can SELECT from. Exclusions are applied by Postgres (expanding NOT IN).
+_LIST_TABLES_SQL = text("""
+    SELECT n.nspname, c.relname
+    FROM pg_class c
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE c.relkind IN ('r','p')
+      AND c.relpersistence <> 't'
+      AND n.nspname NOT IN :excl
+      AND has_table_privilege(c.oid, 'SELECT')
+""").bindparams(bindparam("excl", expanding=True))
 
 def _list_all_tables(conn, exclude_schemas: set) -> List[Tuple[str, str]]:
-    rows = conn.execute(text("""
-        SELECT table_schema, table_name
-        FROM information_schema.tables
-        WHERE table_type='BASE TABLE'
-          AND table_schema NOT IN ('pg_catalog','information_schema','pg_toast')
-    """)).all()
-    return [(r.table_schema, r.table_name) for r in rows if r.table_schema not in exclude_schemas]
+    global _tables_cache
+    key = frozenset(exclude_schemas)
+    cached = _tables_cache
+    if cached is not None and cached[1] == key and time.monotonic() - cached[0] < TABLES_CACHE_TTL_S:
+        return cached[2]
+    tables = [(s, t) for (s, t) in conn.execute(_LIST_TABLES_SQL, {"excl": sorted(exclude_schemas)})]
+    _tables_cache = (time.monotonic(), key, tables)
+    return tables
+
+def _quote_ident(ident: str) -> str:
+    """Safely quote a SQL identifier (schema/table) for Postgres."""
+    return '"' + ident.replace('"', '""') + '"'
 
 def _count_exact(conn, schema: str, table: str) -> int:
-    t = _reflect(schema, table)
-    return conn.execute(select(func.count()).select_from(t)).scalar_one()
+    sql = f"SELECT count(*) FROM {_quote_ident(schema)}.{_quote_ident(table)}"
+    return conn.exec_driver_sql(sql, execution_options={"no_parameters": True}).scalar_one()
 
-def _upsert_daily(conn, snapshot_date: datetime.date, status: str, payload: Dict, error_message: Optional[str]):
-    payload_json = json.dumps(payload, separators=(",", ":"))
-    conn.execute(
-        text("""
-            INSERT INTO nms.nms_daily_reporting (snapshot_date, status, payload, error_message, generated_at)
-            VALUES (:d, :s, CAST(:p AS jsonb), :e, now())
-            ON CONFLICT (snapshot_date)
-            DO UPDATE SET
-              status       = EXCLUDED.status,
-              payload      = EXCLUDED.payload,
-              error_message= EXCLUDED.error_message,
-              generated_at = now()
-        """),
-        {"d": snapshot_date, "s": status, "p": payload_json, "e": error_message},
+def _count_batch(conn, chunk: List[Tuple[str, str]]) -> Dict[str, int]:
+    sql = " UNION ALL ".join(
+        f"SELECT {i} AS i, count(*) AS c FROM {_quote_ident(s)}.{_quote_ident(t)}"
+        for i, (s, t) in enumerate(chunk)
     )
+    try:
+        with conn.begin_nested():
+            # quoted identifiers only, no binds: bypass text() so ':' or '%' in names stay literal
+            res = conn.exec_driver_sql(sql, execution_options={"no_parameters": True})
+            by_index = {r.i: int(r.c) for r in res}
+    except Exception:
+        logging.warning("batched count failed; counting %d tables individually", len(chunk), exc_info=True)
+        return {f"{s}.{t}": int(_count_exact(conn, s, t)) for (s, t) in chunk}
+    return {f"{s}.{t}": by_index[i] for i, (s, t) in enumerate(chunk)}
+
+def _count_batch_pooled(chunk: List[Tuple[str, str]]) -> Dict[str, int]:
+    with engine.connect() as conn:
+        return _count_batch(conn, chunk)
+
+_EMPTY_TABLES_SQL = text("""
+    SELECT x.s, x.t
+    FROM unnest(CAST(:s AS text[]), CAST(:t AS text[])) AS x(s, t)
+    JOIN pg_namespace n ON n.nspname = x.s
+    JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = x.t
+    WHERE c.relkind = 'r' AND pg_relation_size(c.oid) = 0
+""")
+
+def _empty_tables(conn, targets: List[Tuple[str, str]]) -> set:
+    """
+    (schema, table) pairs among targets whose heap has no pages at all, from one catalog query.
+    Uses the live file size, not relpages/reltuples, which are only as fresh as the last
+    VACUUM/ANALYZE. Partitioned parents have no storage of their own and are never reported.
+    """
+    res = conn.execute(_EMPTY_TABLES_SQL, {"s": [s for (s, _) in targets], "t": [t for (_, t) in targets]})
+    return {(s, t) for (s, t) in res}
+
+def _count_exact_many(conn, targets: List[Tuple[str, str]]) -> Dict[str, int]:
+    """
+    Exact counts keyed "schema.table", up to COUNT_BATCH_SIZE tables per round trip:
+      SELECT 0 AS i, count(*) AS c FROM "s1"."t1" UNION ALL SELECT 1, count(*) FROM "s2"."t2" ...
+    Tables with an empty heap are reported as 0 up front and never scanned.
+    A failing batch is rolled back to its savepoint and retried table by table.
+    With more than one batch and COUNT_WORKERS > 1, batches run concurrently on their own
+    pooled connections. Those counts come from separate snapshots, not `conn`'s.
+    """
+    empty = _empty_tables(conn, targets)
+    counts: Dict[str, int] = {f"{s}.{t}": 0 for (s, t) in targets if (s, t) in empty}
+    targets = [(s, t) for (s, t) in targets if (s, t) not in empty]
+    chunks = [targets[i:i + COUNT_BATCH_SIZE] for i in range(0, len(targets), COUNT_BATCH_SIZE)]
+    if COUNT_WORKERS <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            counts.update(_count_batch(conn, chunk))
+        return counts
+    with ThreadPoolExecutor(max_workers=COUNT_WORKERS) as pool:
+        for part in pool.map(_count_batch_pooled, chunks):
+            counts.update(part)
+    return counts
+
+_LIVE_TUPLES_SQL = text("SELECT schemaname, relname, n_live_tup FROM pg_stat_user_tables")
+
+def _count_approx(conn, exclude_schemas: set,
+                  targets: Optional[List[Tuple[str, str]]] = None) -> Dict[str, int]:
+    """
+    Estimated row counts (pg_stat_user_tables.n_live_tup) keyed "schema.table", from a
+    single catalog query instead of a scan per table. With targets, only those are returned.
+    """
+    res = conn.execute(_LIVE_TUPLES_SQL)
+    est = {(s, t): int(n) for (s, t, n) in res if s not in exclude_schemas}
+    if targets is None:
+        return {f"{s}.{t}": n for (s, t), n in est.items()}
+    targets = [(s, t) for (s, t) in targets if s not in exclude_schemas]
+    missing = [f"{s}.{t}" for (s, t) in targets if (s, t) not in est]
+    if missing:
+        raise ValueError(f"tables not found: {', '.join(missing)}")
+    return {f"{s}.{t}": est[(s, t)] for (s, t) in targets}
+
+_UPSERT_DAILY_SQL = text("""
+    INSERT INTO nms.nms_daily_reporting (snapshot_date, status, payload, error_message, generated_at)
+    VALUES (:d, :s, CAST(:p AS jsonb), :e, now())
+    ON CONFLICT (snapshot_date)
+    DO UPDATE SET
+      status       = EXCLUDED.status,
+      payload      = EXCLUDED.payload,
+      error_message= EXCLUDED.error_message,
+      generated_at = now()
+    -- identical re-runs leave the row alone: no new tuple, no WAL, no dead row to vacuum
+    WHERE (nms_daily_reporting.status, nms_daily_reporting.payload, nms_daily_reporting.error_message)
+          IS DISTINCT FROM (EXCLUDED.status, EXCLUDED.payload, EXCLUDED.error_message)
+""")
+
+def _upsert_daily(conn, snapshot_date: datetime.date, status: str, payload: Dict, error_message: Optional[str]):
+    payload_json = _json_dumps(payload)
+    conn.execute(_UPSERT_DAILY_SQL, {"d": snapshot_date, "s": status, "p": payload_json, "e": error_message})
 
 def _parse_event_body(cloud_event: CloudEvent) -> dict:
     """
@@ -119,36 +242,38 @@ def _parse_event_body(cloud_event: CloudEvent) -> dict:
     if isinstance(data, dict) and "message" in data and isinstance(data["message"], dict):
         b64 = data["message"].get("data", "") or ""
         if b64:
-            decoded = base64.b64decode(b64).decode("utf-8")
-            return json.loads(decoded or "{}")
+            raw = base64.b64decode(b64)  # bytes go straight to the parser, no str copy
+            return _json_loads(raw) if raw else {}
         return {}
     # Direct dict payload
     if isinstance(data, dict):
         return data
     # JSON string/bytes
     if isinstance(data, (bytes, str)):
-        s = data.decode("utf-8") if isinstance(data, bytes) else data
         try:
-            return json.loads(s)
+            return _json_loads(data)
         except Exception:
             return {}
     return {}
 
-def _validate_request(body: dict) -> Tuple[str, List[Tuple[str, str]], set, datetime.date]:
+def _validate_request(body: dict) -> Tuple[str, List[Tuple[str, str]], set, datetime.date, bool]:
     """
     Validates and normalizes:
-      returns (mode, targets_list_when_list_mode, exclude_schemas_set, snapshot_date)
+      returns (mode, targets_list_when_list_mode, exclude_schemas_set, snapshot_date, approximate)
     """
     mode = body.get("mode", "all")
     if mode not in ("all", "list"):
         raise ValueError("mode must be 'all' or 'list'")
     exclude_schemas = set(body.get("excludeSchemas", []))
+    approximate = body.get("approximate", False)
+    if not isinstance(approximate, bool):
+        raise ValueError("approximate must be a boolean")
     # snapshot date
     snap_str = body.get("snapshotDate")
     if snap_str:
         snapshot_date = datetime.date.fromisoformat(snap_str)
     else:
-        snapshot_date = datetime.datetime.now(ZoneInfo(SNAPSHOT_TZ)).date()
+        snapshot_date = datetime.datetime.now(_TZ).date()
 
     targets: List[Tuple[str, str]] = []
     if mode == "list":
@@ -160,7 +285,7 @@ def _validate_request(body: dict) -> Tuple[str, List[Tuple[str, str]], set, date
                 raise ValueError(f"table must be 'schema.table': {fq}")
             s, t = fq.split(".", 1)
             targets.append((s, t))
-    return mode, targets, exclude_schemas, snapshot_date
+    return mode, targets, exclude_schemas, snapshot_date, approximate
 
 # ─────────────────────────────
 # CloudEvent entrypoint
@@ -172,43 +297,50 @@ def main(cloud_event: CloudEvent):
         "mode": "all" | "list",
         "tables": ["schema.table", ...],   # only when mode="list"
         "excludeSchemas": ["tmp","stage"], # optional
+        "approximate": false,              # optional; n_live_tup estimates, no scans
         "snapshotDate": "YYYY-MM-DD"       # optional
       }
     """
     body = _parse_event_body(cloud_event)
     try:
-        mode, list_targets, exclude_schemas, snapshot_date = _validate_request(body)
+        mode, list_targets, exclude_schemas, snapshot_date, approximate = _validate_request(body)
+        excluded = SYSTEM_SCHEMAS | exclude_schemas
 
         with engine.begin() as conn:
-            # Determine targets
-            if mode == "all":
-                targets = _list_all_tables(conn, SYSTEM_SCHEMAS | exclude_schemas)
+            if approximate:
+                # Estimates for every table come from one pg_stat_user_tables read; no listing/scans
+                counts = _count_approx(conn, excluded, list_targets if mode == "list" else None)
+                if not counts:
+                    raise ValueError("no tables to process after applying excludeSchemas/system filters")
             else:
-                # Even in 'list' mode, honor excludeSchemas + system schemas
-                targets = [(s, t) for (s, t) in list_targets if s not in (SYSTEM_SCHEMAS | exclude_schemas)]
+                # Determine targets
+                if mode == "all":
+                    targets = _list_all_tables(conn, excluded)
+                else:
+                    # Even in 'list' mode, honor excludeSchemas + system schemas
+                    targets = [(s, t) for (s, t) in list_targets if s not in excluded]
 
-            if not targets:
-                raise ValueError("no tables to process after applying excludeSchemas/system filters")
+                if not targets:
+                    raise ValueError("no tables to process after applying excludeSchemas/system filters")
 
-            # Collect counts
-            counts: Dict[str, int] = {}
-            for (schema, table) in targets:
-                rc = _count_exact(conn, schema, table)
-                counts[f"{schema}.{table}"] = int(rc)
+                # Collect counts
+                counts = _count_exact_many(conn, targets)
 
             # Upsert daily JSON row (SUCCEEDED)
             _upsert_daily(conn, snapshot_date, "SUCCEEDED", counts, None)
 
-        return {"status": "ok", "date": str(snapshot_date), "tablesProcessed": len(counts)}
+        return {"status": "ok", "date": str(snapshot_date), "tablesProcessed": len(counts),
+                "approximate": approximate}
 
     except Exception as e:
         logging.exception("nms daily reporting failed")
+        _invalidate_tables_cache()  # a dropped/renamed table may be why we failed
         # Attempt to record FAILED row (best effort)
         try:
             with engine.begin() as conn:
                 # if we couldn't even parse date, fall back to TZ "today"
                 safe_date = snapshot_date if isinstance(snapshot_date, datetime.date) \
-                    else datetime.datetime.now(ZoneInfo(SNAPSHOT_TZ)).date()
+                    else datetime.datetime.now(_TZ).date()
                 _upsert_daily(conn, safe_date, "FAILED", {}, str(e)[:4000])
         except Exception:
             pass
@@ -1,4 +1,5 @@
-import json, base64, logging, datetime
+import json, base64, logging, datetime, threading, functools, time
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Tuple, Optional
 from zoneinfo import ZoneInfo
 
@@ -10,16 +11,26 @@ from .connections import Connection, ConnectionManager
 
 # ── Config ────────────────────────────────────────────────────────────────────
 SNAPSHOT_TZ = "America/New_York"  # business-day timezone for snapshot_date
-SYSTEM_SCHEMAS = {"pg_catalog", "information_schema", "pg_toast"}
+_TZ = ZoneInfo(SNAPSHOT_TZ)
+SYSTEM_SCHEMAS = frozenset({"pg_catalog", "information_schema", "pg_toast"})
+COUNT_BATCH_SIZE = 100  # tables per UNION ALL count round trip
+COUNT_WORKERS = 4       # parallel count batches, one connection per worker
+TABLES_CACHE_TTL_S = 60  # reuse the table listing for this long on a warm instance
 
 
 # ── Connection helpers ────────────────────────────────────────────────────────
+@functools.lru_cache(maxsize=1)
+def _manager() -> ConnectionManager:
+    """One ConnectionManager per process; any secret/IAM setup it does is paid once."""
+    return ConnectionManager()
+
+
 def _acquire_connection() -> Connection:
     """
     Returns a DB-API connection from your project's ConnectionManager.
     Adjust the method name here if your manager exposes a different one.
     """
-    cm = ConnectionManager()
+    cm = _manager()
     if hasattr(cm, "get_connection"):
         return cm.get_connection()           # preferred if available
     if hasattr(cm, "connect"):
@@ -32,42 +43,172 @@ def _acquire_connection() -> Connection:
 
 
 # ── SQL helpers (safe quoting & basic ops using DB-API) ───────────────────────
+try:
+    import orjson
+
+    _json_loads = orjson.loads  # accepts bytes directly
+
+    def _json_dumps(obj) -> str:
+        return orjson.dumps(obj).decode("utf-8")
+except ImportError:  # orjson is optional; stdlib json gives identical compact output
+    _json_loads = json.loads
+
+    def _json_dumps(obj) -> str:
+        return json.dumps(obj, separators=(",", ":"))
+
+
 def _quote_ident(ident: str) -> str:
     """Safely quote a SQL identifier (schema/table) for Postgres."""
     return '"' + ident.replace('"', '""') + '"'
 
 
-def _list_all_tables(conn: Connection, exclude_schemas: set) -> List[Tuple[str, str]]:
+# (monotonic time, exclude set, tables) from the last listing; reused while fresh
+_tables_cache: Optional[Tuple[float, frozenset, List[Tuple[str, str]]]] = None
+
+
+def _invalidate_tables_cache() -> None:
+    global _tables_cache
+    _tables_cache = None
+
+
+def _list_all_tables(cur, exclude_schemas: set) -> List[Tuple[str, str]]:
+    global _tables_cache
+    key = frozenset(exclude_schemas)
+    cached = _tables_cache
+    if cached is not None and cached[1] == key and time.monotonic() - cached[0] < TABLES_CACHE_TTL_S:
+        return cached[2]
+    # pg_class directly, not the information_schema.tables view: ordinary/partitioned, non-temp
+    # tables the caller can SELECT from. The exclude set is one text[] parameter, filtered server-side.
     sql = """
-        SELECT table_schema, table_name
-        FROM information_schema.tables
-        WHERE table_type = 'BASE TABLE'
-          AND table_schema NOT IN ('pg_catalog','information_schema','pg_toast')
+        SELECT n.nspname, c.relname
+        FROM pg_class c
+        JOIN pg_namespace n ON n.oid = c.relnamespace
+        WHERE c.relkind IN ('r', 'p')
+          AND c.relpersistence <> 't'
+          AND n.nspname <> ALL(%s::text[])
+          AND has_table_privilege(c.oid, 'SELECT')
     """
-    cur = conn.cursor()
-    cur.execute(sql)
-    rows = cur.fetchall()
-    cur.close()
-    return [(s, t) for (s, t) in rows if s not in exclude_schemas]
+    cur.execute(sql, (sorted(exclude_schemas),))
+    tables = [(s, t) for (s, t) in cur.fetchall()]
+    _tables_cache = (time.monotonic(), key, tables)
+    return tables
 
 
-def _count_exact(conn: Connection, schema: str, table: str) -> int:
+def _count_exact(cur, schema: str, table: str) -> int:
     fq = f"{_quote_ident(schema)}.{_quote_ident(table)}"
-    cur = conn.cursor()
     cur.execute(f"SELECT COUNT(*) FROM {fq}")
-    rc = cur.fetchone()[0]
-    cur.close()
-    return int(rc)
+    return int(cur.fetchone()[0])
+
+
+def _count_batch(cur, chunk: List[Tuple[str, str]]) -> Dict[str, int]:
+    sql = " UNION ALL ".join(
+        f"SELECT {i} AS i, COUNT(*) AS c FROM {_quote_ident(s)}.{_quote_ident(t)}"
+        for i, (s, t) in enumerate(chunk)
+    )
+    cur.execute("SAVEPOINT count_batch")
+    try:
+        cur.execute(sql)
+        by_index = {i: int(c) for (i, c) in cur.fetchall()}
+        cur.execute("RELEASE SAVEPOINT count_batch")
+    except Exception:
+        logging.warning("batched count failed; counting %d tables individually", len(chunk), exc_info=True)
+        cur.execute("ROLLBACK TO SAVEPOINT count_batch")
+        return {f"{s}.{t}": _count_exact(cur, s, t) for (s, t) in chunk}
+    return {f"{s}.{t}": by_index[i] for i, (s, t) in enumerate(chunk)}
+
 
+def _empty_tables(cur, targets: List[Tuple[str, str]]) -> set:
+    """
+    (schema, table) pairs among targets whose heap has no pages at all, from one catalog query.
+    Uses the live file size, not relpages/reltuples, which are only as fresh as the last
+    VACUUM/ANALYZE. Partitioned parents have no storage of their own and are never reported.
+    """
+    sql = """
+        SELECT x.s, x.t
+        FROM unnest(%s::text[], %s::text[]) AS x(s, t)
+        JOIN pg_namespace n ON n.nspname = x.s
+        JOIN pg_class c ON c.relnamespace = n.oid AND c.relname = x.t
+        WHERE c.relkind = 'r' AND pg_relation_size(c.oid) = 0
+    """
+    cur.execute(sql, ([s for (s, _) in targets], [t for (_, t) in targets]))
+    return {(s, t) for (s, t) in cur.fetchall()}
 
-def _upsert_daily(conn: Connection, snapshot_date: datetime.date,
+
+def _count_exact_many(cur, targets: List[Tuple[str, str]]) -> Dict[str, int]:
+    """
+    Exact counts keyed "schema.table", up to COUNT_BATCH_SIZE tables per round trip:
+      SELECT 0 AS i, COUNT(*) AS c FROM "s1"."t1" UNION ALL SELECT 1, COUNT(*) FROM "s2"."t2" ...
+    Tables with an empty heap are reported as 0 up front and never scanned.
+    A failing batch is rolled back to a savepoint and retried table by table.
+    With more than one batch and COUNT_WORKERS > 1, batches are spread over worker threads, each
+    counting on its own connection from the ConnectionManager. Those counts come from separate
+    snapshots, not `cur`'s.
+    """
+    empty = _empty_tables(cur, targets)
+    counts: Dict[str, int] = {f"{s}.{t}": 0 for (s, t) in targets if (s, t) in empty}
+    targets = [(s, t) for (s, t) in targets if (s, t) not in empty]
+    chunks = [targets[i:i + COUNT_BATCH_SIZE] for i in range(0, len(targets), COUNT_BATCH_SIZE)]
+    if COUNT_WORKERS <= 1 or len(chunks) <= 1:
+        for chunk in chunks:
+            counts.update(_count_batch(cur, chunk))
+        return counts
+
+    local = threading.local()
+    opened: List[Connection] = []
+
+    def work(chunk: List[Tuple[str, str]]) -> Dict[str, int]:
+        wcur = getattr(local, "cur", None)
+        if wcur is None:
+            wconn = _acquire_connection()
+            opened.append(wconn)
+            wcur = local.cur = wconn.cursor()
+        return _count_batch(wcur, chunk)
+
+    try:
+        with ThreadPoolExecutor(max_workers=COUNT_WORKERS) as pool:
+            for part in pool.map(work, chunks):
+                counts.update(part)
+    finally:
+        for wconn in opened:
+            try:
+                wconn.rollback()  # read-only work; just end the worker's transaction
+            except Exception:
+                pass
+            finally:
+                try:
+                    wconn.close()
+                except Exception:
+                    pass
+    return counts
+
+
+def _count_approx(cur, exclude_schemas: set,
+                  targets: Optional[List[Tuple[str, str]]] = None) -> Dict[str, int]:
+    """
+    Estimated row counts (pg_stat_user_tables.n_live_tup) keyed "schema.table", from a
+    single catalog query instead of a scan per table. With targets, only those are returned.
+    """
+    cur.execute("SELECT schemaname, relname, n_live_tup FROM pg_stat_user_tables")
+    est = {(s, t): int(n) for (s, t, n) in cur.fetchall() if s not in exclude_schemas}
+    if targets is None:
+        return {f"{s}.{t}": n for (s, t), n in est.items()}
+    targets = [(s, t) for (s, t) in targets if s not in exclude_schemas]
+    missing = [f"{s}.{t}" for (s, t) in targets if (s, t) not in est]
+    if missing:
+        raise ValueError(f"tables not found: {', '.join(missing)}")
+    return {f"{s}.{t}": est[(s, t)] for (s, t) in targets}
+
+
+def _upsert_daily(cur, snapshot_date: datetime.date,
                   status: str, payload: Dict[str, int],
                   error_message: Optional[str]) -> None:
     """
     Upsert one row for snapshot_date into nms.nms_daily_reporting.
     Uses DB-API param placeholders (%s) which work for pg8000/psycopg.
+    An identical re-run (same status/payload/error) leaves the existing row untouched,
+    so generated_at keeps the time the current content was first written.
     """
-    payload_json = json.dumps(payload, separators=(",", ":"))
+    payload_json = _json_dumps(payload)
     sql = """
         INSERT INTO nms.nms_daily_reporting
             (snapshot_date, status, payload, error_message, generated_at)
@@ -78,10 +219,10 @@ def _upsert_daily(conn: Connection, snapshot_date: datetime.date,
             payload       = EXCLUDED.payload,
             error_message = EXCLUDED.error_message,
             generated_at  = now()
+        WHERE (nms_daily_reporting.status, nms_daily_reporting.payload, nms_daily_reporting.error_message)
+              IS DISTINCT FROM (EXCLUDED.status, EXCLUDED.payload, EXCLUDED.error_message)
     """
-    cur = conn.cursor()
     cur.execute(sql, (snapshot_date, status, payload_json, error_message))
-    cur.close()
 
 
 # ── CloudEvent parsing ────────────────────────────────────────────────────────
@@ -95,27 +236,27 @@ def _parse_event_body(cloud_event: CloudEvent) -> dict:
     if isinstance(data, dict) and "message" in data and isinstance(data["message"], dict):
         b64 = data["message"].get("data", "") or ""
         if b64:
-            decoded = base64.b64decode(b64).decode("utf-8")
-            return json.loads(decoded or "{}")
+            raw = base64.b64decode(b64)  # bytes go straight to the parser, no str copy
+            return _json_loads(raw) if raw else {}
         return {}
     if isinstance(data, dict):
         return data
     if isinstance(data, (bytes, str)):
-        s = data.decode("utf-8") if isinstance(data, bytes) else data
         try:
-            return json.loads(s)
+            return _json_loads(data)
         except Exception:
             return {}
     return {}
 
 
-def _validate_request(body: dict) -> Tuple[str, List[Tuple[str, str]], set, datetime.date]:
+def _validate_request(body: dict) -> Tuple[str, List[Tuple[str, str]], set, datetime.date, bool]:
     """
     Validates & normalizes the input contract:
     {
       "mode": "all" | "list",
       "tables": ["schema.table", ...],     # required when mode="list"
       "excludeSchemas": ["tmp","stage"],   # optional
+      "approximate": false,                # optional; n_live_tup estimates, no scans
       "snapshotDate": "YYYY-MM-DD"         # optional
     }
     """
@@ -124,12 +265,15 @@ def _validate_request(body: dict) -> Tuple[str, List[Tuple[str, str]], set, date
         raise ValueError("mode must be 'all' or 'list'")
 
     exclude_schemas = set(body.get("excludeSchemas", []))
+    approximate = body.get("approximate", False)
+    if not isinstance(approximate, bool):
+        raise ValueError("approximate must be a boolean")
 
     snap_str = body.get("snapshotDate")
     if snap_str:
         snapshot_date = datetime.date.fromisoformat(snap_str)
     else:
-        snapshot_date = datetime.datetime.now(ZoneInfo(SNAPSHOT_TZ)).date()
+        snapshot_date = datetime.datetime.now(_TZ).date()
 
     targets: List[Tuple[str, str]] = []
     if mode == "list":
@@ -142,7 +286,7 @@ def _validate_request(body: dict) -> Tuple[str, List[Tuple[str, str]], set, date
             s, t = fq.split(".", 1)
             targets.append((s, t))
 
-    return mode, targets, exclude_schemas, snapshot_date
+    return mode, targets, exclude_schemas, snapshot_date, approximate
 
 
 # ── Cloud Function entrypoint (CloudEvent) ────────────────────────────────────
@@ -153,45 +297,53 @@ def main(cloud_event: CloudEvent):
       "mode": "all" | "list",
       "tables": ["schema.table", "..."],   # only when mode="list"
       "excludeSchemas": ["tmp","stage"],   # optional
+      "approximate": false,                # optional; n_live_tup estimates, no scans
       "snapshotDate": "YYYY-MM-DD"         # optional
     }
     """
     body = _parse_event_body(cloud_event)
 
     try:
-        mode, list_targets, exclude_schemas, snapshot_date = _validate_request(body)
+        mode, list_targets, exclude_schemas, snapshot_date, approximate = _validate_request(body)
+        excluded = SYSTEM_SCHEMAS | exclude_schemas
 
         conn = _acquire_connection()
+        cur = conn.cursor()  # one cursor shared by every helper for this request
         try:
             # Start a transaction explicitly
             # (Assumes autocommit False; if your manager uses autocommit, remove commit/rollback.)
-            if mode == "all":
-                targets = _list_all_tables(conn, SYSTEM_SCHEMAS | exclude_schemas)
+            if approximate:
+                # Estimates for every table come from one pg_stat_user_tables read; no listing/scans
+                counts = _count_approx(cur, excluded, list_targets if mode == "list" else None)
+                if not counts:
+                    raise ValueError("no tables to process after applying excludeSchemas/system filters")
             else:
-                targets = [(s, t) for (s, t) in list_targets if s not in (SYSTEM_SCHEMAS | exclude_schemas)]
+                if mode == "all":
+                    targets = _list_all_tables(cur, excluded)
+                else:
+                    targets = [(s, t) for (s, t) in list_targets if s not in excluded]
 
-            if not targets:
-                raise ValueError("no tables to process after applying excludeSchemas/system filters")
+                if not targets:
+                    raise ValueError("no tables to process after applying excludeSchemas/system filters")
 
-            counts: Dict[str, int] = {}
-            for (schema, table) in targets:
-                rc = _count_exact(conn, schema, table)
-                counts[f"{schema}.{table}"] = rc
+                counts = _count_exact_many(cur, targets)
 
-            _upsert_daily(conn, snapshot_date, "SUCCEEDED", counts, None)
+            _upsert_daily(cur, snapshot_date, "SUCCEEDED", counts, None)
             conn.commit()
 
-            return {"status": "ok", "date": str(snapshot_date), "tablesProcessed": len(counts)}
+            return {"status": "ok", "date": str(snapshot_date), "tablesProcessed": len(counts),
+                    "approximate": approximate}
 
         except Exception as e:
             logging.exception("nms daily reporting failed (inner)")
+            _invalidate_tables_cache()  # a dropped/renamed table may be why we failed
             try:
                 conn.rollback()
             except Exception:
                 pass
             # Best-effort FAILED row (separate transaction)
             try:
-                _upsert_daily(conn, snapshot_date, "FAILED", {}, str(e)[:4000])
+                _upsert_daily(cur, snapshot_date, "FAILED", {}, str(e)[:4000])
                 conn.commit()
             except Exception:
                 try:
@@ -201,6 +353,10 @@ def main(cloud_event: CloudEvent):
             return {"status": "error", "date": str(snapshot_date), "message": str(e)}
 
         finally:
+            try:
+                cur.close()
+            except Exception:
+                pass
             try:
                 conn.close()
             except Exception:
@@ -209,6 +365,6 @@ def main(cloud_event: CloudEvent):
     except Exception as e:
         logging.exception("nms daily reporting failed (outer)")
         # If we can't even parse date, fall back to business-day "today"
-        safe_date = datetime.datetime.now(ZoneInfo(SNAPSHOT_TZ)).date()
+        safe_date = datetime.datetime.now(_TZ).date()
         # We can't record to DB here without a connection, so just return error
         return {"status": "error", "date": str(safe_date), "message": str(e)}
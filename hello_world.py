@@ -23,7 +23,7 @@ def main():
     # -----------------------
     # Step 1: Filter only winners
     # -----------------------
-    winner = oscar_nominees[oscar_nominees['winner'] == True]
+    winner = oscar_nominees[oscar_nominees['winner']]
 
     # -----------------------
     # Step 2: Count wins per nominee
@@ -58,13 +58,12 @@ def main():
 
     # -----------------------
     # Step 4: Find the nominee with most wins per top_genre
-    # nlargest(1, 'n_win') -> picks top 1 row by n_win in each group
+    # sort_values() -> most wins first, ties broken by name
+    # drop_duplicates('top_genre') -> keeps the first (top) row of each genre
     # -----------------------
     result = (
-        merged.groupby(['top_genre'])
-        .apply(lambda x: x.nlargest(1, 'n_win'))
-        .reset_index(drop=True)
-        .sort_values(['n_win', 'name'], ascending=[False, True])
+        merged.sort_values(['n_win', 'name'], ascending=[False, True])
+        .drop_duplicates('top_genre', keep='first')
         .head(1)[['top_genre']]
     )
 